@@ -1,3 +1,4 @@
+import os
 import streamlit as st
 from lang_programs import LangChainProgram
 
@@ -6,13 +7,40 @@ st.title('Mirror')
 # Display a sidebar to select the LLM provider
 llm_provider = st.sidebar.selectbox("Select LLM Provider", ["claude-3.5-sonnet","gpt-4o", "lm-studio", "groq", "gemini-pro-1.5-exp"])
 
+# Opt-in background warm-up of the prompt, capsule connection and query cache.
+# MIRROR_WARM_UP in .env turns it on for new sessions; the checkbox overrides it.
+warm_up_default = os.getenv("MIRROR_WARM_UP", "").lower() in ("1", "true", "yes")
+warm_up = st.sidebar.checkbox("Warm up retrieval on start", value=warm_up_default)
+
 # Initialize LangChainProgram instance and store it in the session state
 if "lang_chain_program" not in st.session_state:
-    st.session_state.lang_chain_program = LangChainProgram(llm_provider)
+    st.session_state.lang_chain_program = LangChainProgram(llm_provider, warm_up=warm_up)
 else:
-    # Update the LangChainProgram instance if the llm_provider has changed
-    if st.session_state.lang_chain_program.llm_provider != llm_provider:
-        st.session_state.lang_chain_program = LangChainProgram(llm_provider)
+    # Update the LangChainProgram instance if the llm_provider or warm-up setting has changed
+    program = st.session_state.lang_chain_program
+    if program.llm_provider != llm_provider:
+        st.session_state.lang_chain_program = LangChainProgram(llm_provider, warm_up=warm_up)
+    elif program.use_warm_up != warm_up:
+        # Keep the conversation when only the warm-up setting changes
+        st.session_state.lang_chain_program = LangChainProgram(llm_provider, warm_up=warm_up, memory=program.memory)
+
+warming = st.session_state.lang_chain_program.warm_up_state == "warming"
+
+# Poll the warm-up state every second while it is in progress
+@st.fragment(run_every=1 if warming else None)
+def warm_up_status():
+    program = st.session_state.lang_chain_program
+    if program.warm_up_state == "failed":
+        st.warning(f"Warm-up failed: {program.warm_up_error}")
+    else:
+        st.caption(f"Retrieval warm-up: {program.warm_up_state}")
+    if warming and program.warm_up_state != "warming":
+        # Rerun the whole app once so polling stops
+        st.rerun()
+
+if warm_up:
+    with st.sidebar:
+        warm_up_status()
 
 # Display chat messages from LangChainProgram's memory
 for message in st.session_state.lang_chain_program.memory.messages:
@@ -4,6 +4,12 @@ from langchain_anthropic import ChatAnthropic
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_community.chat_message_histories import ChatMessageHistory
 import os
+import json
+import atexit
+import threading
+import time
+from pathlib import Path
+from typing import Any
 from dotenv import load_dotenv
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.chains import create_retrieval_chain
@@ -14,23 +20,158 @@ from langchain.callbacks.tracers.langchain import wait_for_all_tracers
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain.schema import Document
 from langchain_core.retrievers import BaseRetriever
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 import requests
 
 load_dotenv()
 
+PROMPT_NAME = "dannymac180/openai-mirror-prompt"
+QUERY_CACHE_DIR = Path(__file__).parent / "data" / "query_cache"
+QUERY_CACHE_SIZE = 200
+QUERY_CACHE_TTL = 24 * 60 * 60  # seconds
+QUERY_CACHE_FLUSH_DELAY = 5  # seconds to batch cache writes before saving to disk
+
+# Prompts pulled from the hub and query caches, shared by every LangChainProgram in the process
+_prompt_cache = {}
+_prompt_lock = threading.Lock()
+_query_caches = {}
+_query_cache_lock = threading.Lock()
+
+def load_prompt(name=PROMPT_NAME):
+    with _prompt_lock:
+        if name not in _prompt_cache:
+            _prompt_cache[name] = hub.pull(name)
+        return _prompt_cache[name]
+
+class QueryCache:
+    """Persistent per-capsule cache of recent query -> SID result pairs.
+
+    Entries are kept in recency order (hits and writes both count as a use) in
+    data/query_cache/<capsule_id>.json and expire after `ttl` seconds so that notes
+    synced since then are picked up. Use get_query_cache() rather than creating
+    one directly, so that there is a single writer per file. Writes are batched
+    and saved by a background timer (and at exit), never on the request thread.
+    """
+
+    def __init__(self, capsule_id, max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.path = QUERY_CACHE_DIR / f"{capsule_id}.json"
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = None
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.flush_timer = None
+
+    def load(self):
+        with self.lock:
+            if self.entries is None:
+                self.entries = {}
+                if self.path.exists():
+                    try:
+                        with self.path.open("r") as f:
+                            self.entries = json.load(f)
+                    except (OSError, ValueError) as e:
+                        print(f"Ignoring unreadable query cache {self.path}: {e}")
+            return self.entries
+
+    def get(self, query):
+        entries = self.load()
+        with self.lock:
+            entry = entries.pop(query, None)
+            if entry is None or time.time() - entry["time"] > self.ttl:
+                return None
+            entries[query] = entry
+            return entry["results"]
+
+    def put(self, query, results):
+        entries = self.load()
+        with self.lock:
+            entries.pop(query, None)
+            entries[query] = {"time": time.time(), "results": results}
+            while len(entries) > self.max_entries:
+                del entries[next(iter(entries))]
+            if self.flush_timer is None:
+                self.flush_timer = threading.Timer(QUERY_CACHE_FLUSH_DELAY, self.flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def flush(self):
+        """Save a snapshot of the cache, writing a temp file and swapping it into place."""
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            if self.entries is None:
+                return
+            snapshot = dict(self.entries)
+        with self.write_lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".json.tmp")
+            with tmp_path.open("w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+
+    def most_recent_query(self):
+        entries = self.load()
+        with self.lock:
+            return next(reversed(entries), None)
+
+def get_query_cache(capsule_id):
+    """Return the process-wide QueryCache for a capsule, so sessions never overwrite each other's entries."""
+    with _query_cache_lock:
+        if capsule_id not in _query_caches:
+            _query_caches[capsule_id] = QueryCache(capsule_id)
+            atexit.register(_query_caches[capsule_id].flush)
+        return _query_caches[capsule_id]
+
 class SIDRetriever(BaseRetriever):
     capsule_id: str = Field(...)
     token: str = Field(...)
     url: str = Field(...)
+    query_cache: Any = Field(default=None)
+    _session: requests.Session = PrivateAttr(default_factory=requests.Session)
+    _last_query_ok: bool = PrivateAttr(default=False)
 
-    def __init__(self, capsule_id: str, token: str):
+    def __init__(self, capsule_id: str, token: str, query_cache: QueryCache = None):
         super().__init__()
         self.capsule_id = capsule_id
         self.token = token
         self.url = f"https://{capsule_id}.sid.ai/query"
+        self.query_cache = query_cache
+
+    def warm_up(self, canary_query="warm-up"):
+        """Preload the query cache and open a pooled connection with a canary retrieval."""
+        if self.query_cache is not None:
+            self.query_cache.load()
+            canary_query = self.query_cache.most_recent_query() or canary_query
+        # Unlike query_sid, errors (TLS, auth, timeouts) propagate so warm-up reports "failed"
+        results = self.fetch_results(canary_query)
+        if results and self.query_cache is not None:
+            self.query_cache.put(canary_query, results)
 
     def get_relevant_documents(self, query: str):
+        results = self.query_cache.get(query) if self.query_cache is not None else None
+        if results is None:
+            results = self.query_sid(query)
+            if results and self.query_cache is not None:
+                self.query_cache.put(query, results)
+        return [Document(page_content=doc['content'], metadata=doc.get('metadata', {}))
+                for doc in results]
+
+    @property
+    def last_query_ok(self):
+        """Whether the most recent request to the capsule succeeded."""
+        return self._last_query_ok
+
+    def query_sid(self, query: str):
+        try:
+            return self.fetch_results(query)
+        except requests.RequestException as e:
+            print(f"Error querying SID API: {e}")
+            return []
+
+    def fetch_results(self, query: str):
+        self._last_query_ok = False
         payload = {
             "query": query,
             "limit": 5,  # Adjust as needed
@@ -41,40 +182,70 @@ class SIDRetriever(BaseRetriever):
             "Content-Type": "application/json"
         }
 
-        try:
-            response = requests.post(self.url, json=payload, headers=headers)
-            response.raise_for_status()
-            results = response.json()
-            print(f"Results type: {type(results)}, Content: {results}")  # For debugging
-
-            if isinstance(results, list):
-                documents = [Document(page_content=doc['content'], metadata=doc.get('metadata', {})) 
-                             for doc in results]
-            elif isinstance(results, dict) and 'documents' in results:
-                documents = [Document(page_content=doc['content'], metadata=doc.get('metadata', {})) 
-                             for doc in results['documents']]
-            else:
-                print(f"Unexpected response format: {results}")
-                documents = []
-            return documents
-        except requests.RequestException as e:
-            print(f"Error querying SID API: {e}")
+        response = self._session.post(self.url, json=payload, headers=headers)
+        response.raise_for_status()
+        results = response.json()
+        self._last_query_ok = True
+        print(f"Results type: {type(results)}, Content: {results}")  # For debugging
+
+        if isinstance(results, list):
+            return results
+        elif isinstance(results, dict) and 'documents' in results:
+            return results['documents']
+        else:
+            print(f"Unexpected response format: {results}")
             return []
 
 class LangChainProgram:
-    def __init__(self, llm_provider):
+    def __init__(self, llm_provider, warm_up=False, memory=None):
         self.llm_provider = llm_provider
-        self.llm = self.create_llm()
-        self.memory = ChatMessageHistory()
-        self.retriever = self.load_retriever()
-        self.retrieval_qa_chat_prompt = hub.pull("dannymac180/openai-mirror-prompt")
-        self.combine_docs_chain = create_stuff_documents_chain(self.llm, self.retrieval_qa_chat_prompt)
-        self.retrieval_chain = create_retrieval_chain(self.retriever, self.combine_docs_chain)
+        self.use_warm_up = warm_up
+        self.memory = memory if memory is not None else ChatMessageHistory()
+        self.retrieval_chain = None
+        self.chain_lock = threading.Lock()
+        # One of "cold", "warming", "ready" or "failed"; shown in the UI
+        self.warm_up_state = "cold"
+        self.warm_up_error = None
+        if warm_up:
+            self.warm_up_state = "warming"
+            self.warm_up_thread = threading.Thread(target=self.warm_up, daemon=True)
+            self.warm_up_thread.start()
+        else:
+            self.build_chain()
+
+    def build_chain(self):
+        with self.chain_lock:
+            if self.retrieval_chain is not None:
+                return
+            self.llm = self.create_llm()
+            self.retriever = self.load_retriever()
+            self.retrieval_qa_chat_prompt = load_prompt()
+            self.combine_docs_chain = create_stuff_documents_chain(self.llm, self.retrieval_qa_chat_prompt)
+            self.retrieval_chain = create_retrieval_chain(self.retriever, self.combine_docs_chain)
+            # A rebuild after a failed warm-up leaves the program usable again
+            self.clear_failed_warm_up()
+
+    def clear_failed_warm_up(self):
+        if self.warm_up_state == "failed":
+            self.warm_up_state = "ready"
+            self.warm_up_error = None
+
+    def warm_up(self):
+        """Build the chain and warm the retriever ahead of the first question."""
+        try:
+            self.build_chain()
+            self.retriever.warm_up()
+            self.warm_up_state = "ready"
+        except Exception as e:
+            self.warm_up_error = str(e)
+            self.warm_up_state = "failed"
+            print(f"Warm-up failed: {e}")
         
     def load_retriever(self):
         capsule_id = os.getenv("SID_CAPSULE_ID")
         token = os.getenv("SID_API_KEY")
-        return SIDRetriever(capsule_id, token)
+        query_cache = get_query_cache(capsule_id) if self.use_warm_up else None
+        return SIDRetriever(capsule_id, token, query_cache=query_cache)
         
     def create_llm(self):
         if self.llm_provider == "lm-studio":
@@ -106,6 +277,8 @@ class LangChainProgram:
             raise ValueError(f"Invalid LLM provider: {self.llm_provider}")
     
     def invoke_chat(self, message):
+        # Waits for an in-flight warm-up to finish building the chain
+        self.build_chain()
         self.memory.add_user_message(message)
         response = ""
         
@@ -130,5 +303,7 @@ class LangChainProgram:
             yield answer  # Only yield the actual answer text
         
         self.memory.add_ai_message(response)
+        if self.retriever.last_query_ok:
+            self.clear_failed_warm_up()
         
         wait_for_all_tracers()
\ No newline at end of file
@@ -1,3 +1,4 @@
+import argparse
 import json
 import os
 from dotenv import load_dotenv
@@ -10,22 +11,31 @@ from langchain.text_splitter import CharacterTextSplitter
 from utils.update_sid_capsule import (
     load_json_file, save_json_file, log_with_timestamp, retry_operation,
     delete_from_sid, add_to_sid, get_all_sid_items, calculate_file_hash,
-    OBSIDIAN_PATH, SID_BASE_URL, SID_API_KEY
+    OBSIDIAN_PATH, SID_BASE_URL, SID_API_KEY, metrics
 )
+from utils.sync_metrics import RunProfiler
 
 load_dotenv()
 
 script_dir = Path(__file__).parent.absolute()
 sid_cache_path = script_dir / "sid_cache.json"
+report_path = script_dir / "reconcile_report.json"
+prometheus_path = script_dir / "reconcile_report.prom"
+profile_path = script_dir / "reconcile_profile.prof"
 
 def get_all_obsidian_files():
     obsidian_loader = ObsidianLoader(OBSIDIAN_PATH)
-    all_docs = obsidian_loader.load()
+    with metrics.stage("vault_load"):
+        all_docs = obsidian_loader.load()
+    metrics.increment("documents_loaded", len(all_docs))
     return {doc.metadata['path']: doc for doc in all_docs}
 
 def split_document(doc):
     text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    return text_splitter.split_documents([doc])
+    with metrics.stage("split"):
+        split_docs = text_splitter.split_documents([doc])
+    metrics.increment("chunks_split", len(split_docs))
+    return split_docs
 
 def reconcile_documents():
     log_with_timestamp("Starting SID capsule reconciliation process")
@@ -86,13 +96,27 @@ def process_document(source, docs):
     
     return chunks_uploaded == len(docs)
 
-def main():
+def main(profile=False):
+    metrics.reset("reconcile")
+    profiler = RunProfiler(profile_path) if profile else None
     try:
-        reconcile_documents()
+        if profiler:
+            with profiler:
+                reconcile_documents()
+        else:
+            reconcile_documents()
     except Exception as e:
         log_with_timestamp(f"An error occurred: {str(e)}", severity="ERROR")
         with open('reconciliation_error_log.txt', 'a') as f:
             f.write(f"{datetime.now()}: {str(e)}\n")
+    finally:
+        extra = {"profile": profiler.summary} if profiler else None
+        metrics.write_report(report_path, prometheus_path, extra=extra)
+        log_with_timestamp(f"Reconciliation report written to {report_path} and {prometheus_path}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Reconcile the SID capsule with the full Obsidian vault.")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Capture cProfile/tracemalloc data for the run (written to {profile_path.name})")
+    args = parser.parse_args()
+    main(profile=args.profile)
\ No newline at end of file
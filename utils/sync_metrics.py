@@ -0,0 +1,168 @@
+import cProfile
+import json
+import pstats
+import io
+import re
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class SyncMetrics:
+    """Collects per-stage timings, counters and request latencies for one sync run.
+
+    Stage timers are cumulative across calls, and time spent outside any stage
+    (e.g. reading and writing the JSON state files) is not counted, so stage
+    totals are not meant to add up to the run duration.
+    """
+
+    def __init__(self, run_name):
+        self.reset(run_name)
+
+    def reset(self, run_name):
+        self.run_name = run_name
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.latencies = {}
+
+    @contextmanager
+    def stage(self, name):
+        stage_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            stats["seconds"] += time.perf_counter() - stage_start
+            stats["calls"] += 1
+
+    def increment(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe_latency(self, operation, seconds):
+        self.latencies.setdefault(operation, []).append(seconds)
+
+    def latency_summary(self):
+        summary = {}
+        for operation, samples in self.latencies.items():
+            ordered = sorted(samples)
+            summary[operation] = {
+                "count": len(ordered),
+                "sum": sum(ordered),
+                "p50": percentile(ordered, 50),
+                "p90": percentile(ordered, 90),
+                "p99": percentile(ordered, 99),
+                "max": ordered[-1],
+            }
+        return summary
+
+    def report(self):
+        return {
+            "run": self.run_name,
+            "started_at": self.started_at.isoformat(),
+            "duration_seconds": time.perf_counter() - self.start,
+            "stages": self.stages,
+            "counters": self.counters,
+            "request_latency_seconds": self.latency_summary(),
+        }
+
+    def to_prometheus(self):
+        report = self.report()
+        labels = f'run="{escape_label(self.run_name)}"'
+        lines = [
+            "# HELP sid_sync_duration_seconds Wall-clock duration of the sync run.",
+            "# TYPE sid_sync_duration_seconds gauge",
+            f"sid_sync_duration_seconds{{{labels}}} {report['duration_seconds']:.6f}",
+            "# HELP sid_sync_stage_seconds Cumulative time spent in each sync stage.",
+            "# TYPE sid_sync_stage_seconds gauge",
+        ]
+        for name, stats in self.stages.items():
+            lines.append(f'sid_sync_stage_seconds{{{labels},stage="{escape_label(name)}"}} {stats["seconds"]:.6f}')
+        lines += [
+            "# HELP sid_sync_stage_calls Number of times each sync stage was entered.",
+            "# TYPE sid_sync_stage_calls gauge",
+        ]
+        for name, stats in self.stages.items():
+            lines.append(f'sid_sync_stage_calls{{{labels},stage="{escape_label(name)}"}} {stats["calls"]}')
+        # One gauge per counter; names carry their unit (bytes_uploaded, chunks_uploaded, ...)
+        for name, value in self.counters.items():
+            metric = "sid_sync_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+            lines += [
+                f"# HELP {metric} Value of the {name} counter for the sync run.",
+                f"# TYPE {metric} gauge",
+                f"{metric}{{{labels}}} {value}",
+            ]
+        lines += [
+            "# HELP sid_sync_request_latency_seconds SID API request latency.",
+            "# TYPE sid_sync_request_latency_seconds summary",
+        ]
+        for operation, summary in report["request_latency_seconds"].items():
+            op_labels = f'{labels},operation="{escape_label(operation)}"'
+            for quantile in ("p50", "p90", "p99"):
+                q = int(quantile[1:]) / 100
+                lines.append(f'sid_sync_request_latency_seconds{{{op_labels},quantile="{q}"}} {summary[quantile]:.6f}')
+            lines.append(f"sid_sync_request_latency_seconds_sum{{{op_labels}}} {summary['sum']:.6f}")
+            lines.append(f"sid_sync_request_latency_seconds_count{{{op_labels}}} {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, json_path=None, prom_path=None, extra=None):
+        report = self.report()
+        if extra:
+            report.update(extra)
+        if json_path:
+            with open(json_path, "w") as f:
+                json.dump(report, f, indent=2)
+        if prom_path:
+            with open(prom_path, "w") as f:
+                f.write(self.to_prometheus())
+        return report
+
+
+def escape_label(value):
+    """Escape a label value for the Prometheus text exposition format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+class RunProfiler:
+    """Opt-in cProfile + tracemalloc capture around a sync run."""
+
+    def __init__(self, profile_path, top_n=25):
+        self.profile_path = profile_path
+        self.top_n = top_n
+        self.profiler = cProfile.Profile()
+        self.summary = {}
+
+    def __enter__(self):
+        tracemalloc.start()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.profiler.dump_stats(self.profile_path)
+        stats_stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stats_stream).sort_stats("cumulative").print_stats(self.top_n)
+
+        self.summary = {
+            "cprofile_path": str(self.profile_path),
+            "cprofile_top": stats_stream.getvalue(),
+            "memory_current_bytes": current,
+            "memory_peak_bytes": peak,
+            "top_allocations": [
+                {"location": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:self.top_n]
+            ],
+        }
+        return False
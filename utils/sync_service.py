@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from utils.update_sid_capsule import SyncTarget, sync_target, log_with_timestamp
+except ImportError:
+    # Run directly as a script
+    from update_sid_capsule import SyncTarget, sync_target, log_with_timestamp
+
+script_dir = Path(__file__).parent.absolute()
+config_path = script_dir / "sync_targets.json"
+
+DEFAULT_INTERVAL = 300  # seconds between scheduler passes
+DEFAULT_MAX_WORKERS = 4
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rate` requests per second with bursts of `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def create_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return session
+
+def load_targets(config, session, global_limiter=None):
+    """Build a SyncTarget for each entry of the `targets` list in the config.
+
+    Each entry needs `name`, `vault_path`, `capsule_id` and `state_dir`. The API key
+    is read from the environment variable named by `api_key_env` (default SID_API_KEY)
+    so that secrets stay out of the config file.
+    """
+    targets = []
+    names = set()
+    for entry in config.get("targets", []):
+        name = entry["name"]
+        if name in names:
+            raise ValueError(f"Duplicate sync target name: {name}")
+        names.add(name)
+
+        api_key_env = entry.get("api_key_env", "SID_API_KEY")
+        api_key = os.getenv(api_key_env)
+        if not api_key:
+            raise ValueError(f"Sync target {name}: environment variable {api_key_env} is not set")
+
+        vault_path = os.path.expanduser(entry["vault_path"])
+        if not Path(vault_path).is_dir():
+            raise ValueError(f"Sync target {name}: vault_path {vault_path} is not a directory")
+
+        limiters = [global_limiter] if global_limiter else []
+        if entry.get("requests_per_second"):
+            limiters.insert(0, RateLimiter(entry["requests_per_second"], entry.get("burst", 1)))
+
+        state_dir = Path(entry["state_dir"]).expanduser()
+        if not state_dir.is_absolute():
+            state_dir = script_dir / state_dir
+        state_dir.mkdir(parents=True, exist_ok=True)
+
+        targets.append(SyncTarget(
+            name=name,
+            vault_path=vault_path,
+            capsule_id=entry["capsule_id"],
+            api_key=api_key,
+            state_dir=state_dir,
+            upload_interval=entry.get("upload_interval", 1.0),
+            session=session,
+            limiters=limiters,
+        ))
+    return targets
+
+def log_failed_sync(future, target):
+    """Log an exception that escaped sync_target, e.g. while writing the run report."""
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        log_with_timestamp(f"Sync failed: {error}", severity="ERROR", target=target)
+
+class SyncService:
+    """Runs every configured vault -> capsule target from one process.
+
+    Targets share one connection pool and one global rate limit, run concurrently
+    on a thread pool, and keep their hash, stat and cache state in their own
+    `state_dir`. A target that is still syncing is skipped by the next pass
+    rather than started twice.
+    """
+
+    def __init__(self, config):
+        self.interval = config.get("interval", DEFAULT_INTERVAL)
+        self.max_workers = config.get("max_workers", DEFAULT_MAX_WORKERS)
+        self.profile = config.get("profile", False)
+        if self.profile:
+            # tracemalloc is process-wide, so profiled targets have to run one at a time
+            self.max_workers = 1
+        global_rate = config.get("global_requests_per_second")
+        self.global_limiter = RateLimiter(global_rate, config.get("global_burst", 1)) if global_rate else None
+        self.session = create_session(self.max_workers * 2)
+        self.targets = load_targets(config, self.session, self.global_limiter)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sid-sync")
+        self.running = {}
+
+    def run_pass(self):
+        futures = []
+        for target in self.targets:
+            running = self.running.get(target.name)
+            if running and not running.done():
+                log_with_timestamp("Previous sync still running, skipping this pass", severity="WARNING", target=target)
+                continue
+            future = self.executor.submit(sync_target, target, self.profile)
+            future.add_done_callback(lambda done, target=target: log_failed_sync(done, target))
+            self.running[target.name] = future
+            futures.append(future)
+        return futures
+
+    def run_once(self):
+        futures = self.run_pass()
+        # Let every target finish before re-raising the first failure (already logged by log_failed_sync)
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    def run_forever(self):
+        log_with_timestamp(f"Starting SID sync service for {len(self.targets)} targets every {self.interval} seconds")
+        try:
+            while True:
+                started = time.monotonic()
+                self.run_pass()
+                time.sleep(max(0, self.interval - (time.monotonic() - started)))
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync several Obsidian vaults to their SID capsules from one process.")
+    parser.add_argument("--config", type=Path, default=config_path,
+                        help=f"JSON file describing the sync targets (default: {config_path.name})")
+    parser.add_argument("--once", action="store_true", help="Run a single pass over all targets and exit")
+    parser.add_argument("--profile", action="store_true",
+                        help="Capture cProfile/tracemalloc data for each target run")
+    args = parser.parse_args()
+
+    with args.config.open("r") as f:
+        config = json.load(f)
+    if args.profile:
+        config["profile"] = True
+
+    service = SyncService(config)
+    try:
+        if args.once:
+            service.run_once()
+        else:
+            service.run_forever()
+    except Exception as e:
+        log_with_timestamp(f"An error occurred: {str(e)}", severity="ERROR")
+        with open('error_log.txt', 'a') as f:
+            f.write(f"{datetime.now()}: {str(e)}\n")
+    finally:
+        service.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
+import argparse
 import json
 import os
 import requests
 import hashlib
+import tempfile
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
 from datetime import datetime
 from pathlib import Path
@@ -13,6 +16,12 @@ from requests.exceptions import Timeout, RequestException
 from langchain_community.document_loaders import ObsidianLoader
 from langchain.text_splitter import CharacterTextSplitter
 
+try:
+    from utils.sync_metrics import SyncMetrics, RunProfiler
+except ImportError:
+    # Run directly as a script (e.g. from monitor_obsidian.py)
+    from sync_metrics import SyncMetrics, RunProfiler
+
 load_dotenv()
 
 # Initialize constants
@@ -29,19 +38,95 @@ logger = client.logger('sid-capsule-update-logs')
 
 # Get the directory of the current script
 script_dir = Path(__file__).parent.absolute()
-hash_db_path = script_dir / "sid_hash_db.json"
-sid_cache_path = script_dir / "sid_cache.json"
 
 MAX_RETRIES = 3
 RETRY_DELAY = 5  # seconds
 
-def calculate_file_hash(file_path):
-    with open(file_path, "rb") as f:
+@dataclass
+class SyncTarget:
+    """One Obsidian vault -> SID capsule pair and the state kept for it.
+
+    `session` and `limiters` are shared by the sync service across targets;
+    a standalone run leaves them unset and talks to SID through `requests`.
+    """
+    name: str
+    vault_path: str
+    capsule_id: str
+    api_key: str
+    state_dir: Path
+    upload_interval: float = 1.0  # seconds between chunk uploads
+    session: requests.Session = None
+    limiters: list = field(default_factory=list)
+    metrics: SyncMetrics = None
+
+    def __post_init__(self):
+        self.state_dir = Path(self.state_dir)
+        if self.metrics is None:
+            self.metrics = SyncMetrics(self.name)
+
+    @property
+    def base_url(self):
+        return f"https://{self.capsule_id}.sid.ai/data"
+
+    @property
+    def hash_db_path(self):
+        return self.state_dir / "sid_hash_db.json"
+
+    @property
+    def stat_db_path(self):
+        return self.state_dir / "sid_stat_db.json"
+
+    @property
+    def sid_cache_path(self):
+        return self.state_dir / "sid_cache.json"
+
+    @property
+    def report_path(self):
+        return self.state_dir / "sync_report.json"
+
+    @property
+    def prometheus_path(self):
+        return self.state_dir / "sync_report.prom"
+
+    @property
+    def profile_path(self):
+        return self.state_dir / "sync_profile.prof"
+
+    @property
+    def http(self):
+        return self.session or requests
+
+    def acquire(self):
+        for limiter in self.limiters:
+            limiter.acquire()
+
+# The target configured through the environment, used when this module runs as a script
+default_target = SyncTarget(
+    name="default",
+    vault_path=OBSIDIAN_PATH,
+    capsule_id=CAPSULE_ID,
+    api_key=SID_API_KEY,
+    state_dir=script_dir,
+)
+hash_db_path = default_target.hash_db_path
+sid_cache_path = default_target.sid_cache_path
+report_path = default_target.report_path
+prometheus_path = default_target.prometheus_path
+profile_path = default_target.profile_path
+
+# Shared by every function in this module and by reconcile_sid_capsule.py
+metrics = default_target.metrics
+
+def calculate_file_hash(file_path, target=None):
+    target = target or default_target
+    with target.metrics.stage("hash"), open(file_path, "rb") as f:
         file_hash = hashlib.md5()
         chunk = f.read(8192)
         while chunk:
+            target.metrics.increment("bytes_hashed", len(chunk))
             file_hash.update(chunk)
             chunk = f.read(8192)
+    target.metrics.increment("files_hashed")
     return file_hash.hexdigest()
 
 def load_json_file(file_path):
@@ -54,33 +139,58 @@ def save_json_file(data, file_path):
     with file_path.open("w") as f:
         json.dump(data, f)
 
-def log_with_timestamp(message, severity="INFO"):
+def log_with_timestamp(message, severity="INFO", target=None):
+    if target and target is not default_target:
+        message = f"[{target.name}] {message}"
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"{timestamp} - {severity}: {message}")
-    logger.log_text(message, severity=severity)
+    with (target or default_target).metrics.stage("logging"):
+        logger.log_text(message, severity=severity)
+
+def retry_operation(operation, *args, target=None, stage="request", **kwargs):
+    """Call `operation` with retries, timing each attempt under `stage`.
 
-def retry_operation(operation, *args, **kwargs):
+    `stage` is also the operation label of the request latency percentiles.
+    Rate-limit and retry waits are reported as their own stages so that they
+    do not inflate the upload/delete/list time.
+    """
+    target = target or default_target
     for attempt in range(MAX_RETRIES):
+        if target.limiters:
+            with target.metrics.stage("rate_limit_wait"):
+                target.acquire()
+        target.metrics.increment("requests")
+        request_start = time.perf_counter()
         try:
-            return operation(*args, **kwargs)
+            with target.metrics.stage(stage):
+                response = operation(*args, **kwargs)
+            target.metrics.observe_latency(stage, time.perf_counter() - request_start)
+            return response
         except (Timeout, RequestException) as e:
+            target.metrics.observe_latency(stage, time.perf_counter() - request_start)
+            target.metrics.increment("request_errors")
             if attempt == MAX_RETRIES - 1:
                 raise
-            log_with_timestamp(f"Operation failed, retrying in {RETRY_DELAY} seconds... (Attempt {attempt + 1}/{MAX_RETRIES})", severity="WARNING")
-            time.sleep(RETRY_DELAY)
+            log_with_timestamp(f"Operation failed, retrying in {RETRY_DELAY} seconds... (Attempt {attempt + 1}/{MAX_RETRIES})", severity="WARNING", target=target)
+            target.metrics.increment("retries")
+            with target.metrics.stage("retry_wait"):
+                time.sleep(RETRY_DELAY)
 
-def delete_from_sid(item_id):
-    url = f"{SID_BASE_URL}"
-    headers = {"Authorization": f"Bearer {SID_API_KEY}"}
+def delete_from_sid(item_id, target=None):
+    target = target or default_target
+    url = f"{target.base_url}"
+    headers = {"Authorization": f"Bearer {target.api_key}"}
     params = {"item_id": item_id}
-    
-    response = retry_operation(requests.delete, url, headers=headers, params=params)
+
+    response = retry_operation(target.http.delete, url, headers=headers, params=params, target=target, stage="delete")
     response.raise_for_status()
-    log_with_timestamp(f"Successfully deleted item with ID: {item_id}")
+    target.metrics.increment("items_deleted")
+    log_with_timestamp(f"Successfully deleted item with ID: {item_id}", target=target)
     return True
 
-def add_to_sid(content, metadata):
-    url = f"{SID_BASE_URL}/file"
+def add_to_sid(content, metadata, target=None):
+    target = target or default_target
+    url = f"{target.base_url}/file"
     multipart_data = MultipartEncoder(
         fields={
             'file': ('file', content, 'text/plain'),
@@ -90,148 +200,245 @@ def add_to_sid(content, metadata):
         }
     )
     headers = {
-        "Authorization": f"Bearer {SID_API_KEY}",
+        "Authorization": f"Bearer {target.api_key}",
         "Content-Type": multipart_data.content_type
     }
-    
-    response = retry_operation(requests.post, url, headers=headers, data=multipart_data)
+
+    response = retry_operation(target.http.post, url, headers=headers, data=multipart_data, target=target, stage="upload")
     response.raise_for_status()
-    log_with_timestamp(f"Successfully uploaded chunk to SID: {metadata.get('source', '')}")
+    target.metrics.increment("chunks_uploaded")
+    target.metrics.increment("bytes_uploaded", multipart_data.len)
+    log_with_timestamp(f"Successfully uploaded chunk to SID: {metadata.get('source', '')}", target=target)
     return True
 
-def get_all_sid_items():
-    url = f"{SID_BASE_URL}"
-    headers = {"Authorization": f"Bearer {SID_API_KEY}"}
-    
-    response = retry_operation(requests.get, url, headers=headers)
+def get_all_sid_items(target=None):
+    target = target or default_target
+    url = f"{target.base_url}"
+    headers = {"Authorization": f"Bearer {target.api_key}"}
+
+    response = retry_operation(target.http.get, url, headers=headers, target=target, stage="list_items")
     response.raise_for_status()
     return response.json()
 
-def update_sid_cache():
-    items = get_all_sid_items()
+def update_sid_cache(target=None):
+    target = target or default_target
+    items = get_all_sid_items(target)
     sid_cache = {item['uri']: item['item_id'] for item in items if 'uri' in item and 'item_id' in item}
-    save_json_file(sid_cache, sid_cache_path)
+    save_json_file(sid_cache, target.sid_cache_path)
     return sid_cache
 
-def load_documents():
-    obsidian_loader = ObsidianLoader(OBSIDIAN_PATH)
-    file_hash_db = load_json_file(hash_db_path)
+def load_changed_notes(paths):
+    """Load only the given notes through ObsidianLoader instead of the whole vault.
+
+    Each note is symlinked into its own folder of a scratch directory (keeping its
+    file name), that directory is loaded with ObsidianLoader, and each Document's
+    `path` is pointed back at the real note. stat() follows the links, so the
+    timestamps in the metadata are those of the real files.
+    """
+    with tempfile.TemporaryDirectory(prefix="sid-notes-") as scratch_dir:
+        real_paths = {}
+        for i, path in enumerate(paths):
+            link = Path(scratch_dir) / str(i) / Path(path).name
+            link.parent.mkdir()
+            link.symlink_to(Path(path).absolute())
+            real_paths[str(link)] = str(path)
+
+        docs = ObsidianLoader(scratch_dir).load()
+        for doc in docs:
+            doc.metadata['path'] = real_paths[doc.metadata['path']]
+        return docs
+
+def scan_vault(target):
+    """Return {path: [mtime_ns, size]} for every note in the vault, without reading any file.
+
+    Returns None when the vault directory is missing (e.g. an unmounted drive), so
+    that its notes are not mistaken for deletions.
+    """
+    if not target.vault_path or not Path(target.vault_path).is_dir():
+        log_with_timestamp(f"Vault directory not found, skipping sync: {target.vault_path}", severity="ERROR", target=target)
+        return None
+
+    with target.metrics.stage("scan"):
+        file_stats = {}
+        for path in Path(target.vault_path).glob("**/*.md"):
+            stat = path.stat()
+            file_stats[str(path)] = [stat.st_mtime_ns, stat.st_size]
+    target.metrics.increment("files_scanned", len(file_stats))
+    return file_stats
+
+def load_documents(target=None):
+    target = target or default_target
+    file_hash_db = load_json_file(target.hash_db_path)
+    stat_db = load_json_file(target.stat_db_path)
     new_or_modified_docs = []
-    current_files = set()
-    
+
     try:
-        all_docs = obsidian_loader.load()
-        for doc in all_docs:
+        # Only notes whose stat changed since the last run are read, parsed and hashed
+        file_stats = scan_vault(target)
+        if file_stats is None:
+            return [], set()
+        changed_files = [path for path, stat in file_stats.items()
+                         if path not in file_hash_db or stat_db.get(path) != stat]
+        deleted_files = set(file_hash_db.keys()) - set(file_stats)
+        if not changed_files and not deleted_files:
+            return [], set()
+
+        with target.metrics.stage("vault_load"):
+            changed_docs = load_changed_notes(changed_files)
+        target.metrics.increment("documents_loaded", len(changed_docs))
+        for doc in changed_docs:
             file_path = doc.metadata.get('path')
             if file_path:
-                current_files.add(file_path)
-                current_hash = calculate_file_hash(file_path)
+                current_hash = calculate_file_hash(file_path, target)
                 if file_path not in file_hash_db or file_hash_db[file_path] != current_hash:
                     new_or_modified_docs.append(doc)
                     file_hash_db[file_path] = current_hash
-        
-        deleted_files = set(file_hash_db.keys()) - current_files
+
         for deleted_file in deleted_files:
             del file_hash_db[deleted_file]
-        
-        save_json_file(file_hash_db, hash_db_path)
+
+        save_json_file(file_hash_db, target.hash_db_path)
+        save_json_file({path: file_stats[path] for path in file_hash_db if path in file_stats}, target.stat_db_path)
         return new_or_modified_docs, deleted_files
     except Exception as e:
-        log_with_timestamp(f"Error loading documents: {str(e)}", severity="ERROR")
+        log_with_timestamp(f"Error loading documents: {str(e)}", severity="ERROR", target=target)
         return [], set()
 
-def split_documents(documents):
+def split_documents(documents, target=None):
+    target = target or default_target
     text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    return text_splitter.split_documents(documents)
+    with target.metrics.stage("split"):
+        split_docs = text_splitter.split_documents(documents)
+    target.metrics.increment("chunks_split", len(split_docs))
+    return split_docs
+
+def process_document(source, docs, sid_cache, target=None):
+    target = target or default_target
+    log_with_timestamp(f"Processing document: {source}", target=target)
 
-def process_document(source, docs, sid_cache):
-    log_with_timestamp(f"Processing document: {source}")
-    
     item_id = sid_cache.get(source)
     if item_id:
-        if delete_from_sid(item_id):
-            log_with_timestamp(f"Deleted old version of document from SID: {source}")
+        if delete_from_sid(item_id, target):
+            log_with_timestamp(f"Deleted old version of document from SID: {source}", target=target)
         else:
-            log_with_timestamp(f"Failed to delete old version from SID: {source}", severity="ERROR")
+            log_with_timestamp(f"Failed to delete old version from SID: {source}", severity="ERROR", target=target)
             return False
-    
+
     chunks_uploaded = 0
     for i, doc in enumerate(docs, 1):
-        if add_to_sid(doc.page_content, doc.metadata):
+        if add_to_sid(doc.page_content, doc.metadata, target):
             chunks_uploaded += 1
         else:
-            log_with_timestamp(f"Failed to upload document chunk {i}/{len(docs)} to SID capsule: {source}", severity="ERROR")
+            log_with_timestamp(f"Failed to upload document chunk {i}/{len(docs)} to SID capsule: {source}", severity="ERROR", target=target)
             return False
-        time.sleep(1)
-    
+        with target.metrics.stage("throttle"):
+            time.sleep(target.upload_interval)
+
     return chunks_uploaded == len(docs)
 
-def update_documents(split_docs):
-    sid_cache = update_sid_cache()
-    file_hash_db = load_json_file(hash_db_path)
+def update_documents(split_docs, target=None):
+    target = target or default_target
+    if not split_docs:
+        return 0
+
+    sid_cache = update_sid_cache(target)
+    file_hash_db = load_json_file(target.hash_db_path)
     successful_updates = 0
     docs_by_source = {}
-    
+
     for doc in split_docs:
         source = doc.metadata.get('path')
         if source:
             if source not in docs_by_source:
                 docs_by_source[source] = []
             docs_by_source[source].append(doc)
-    
+
     for source, docs in docs_by_source.items():
-        if process_document(source, docs, sid_cache):
-            file_hash_db[source] = calculate_file_hash(source)
+        if process_document(source, docs, sid_cache, target):
+            file_hash_db[source] = calculate_file_hash(source, target)
             successful_updates += 1
         else:
-            log_with_timestamp(f"Failed to update document: {source}", severity="ERROR")
-    
-    save_json_file(file_hash_db, hash_db_path)
+            log_with_timestamp(f"Failed to update document: {source}", severity="ERROR", target=target)
+
+    save_json_file(file_hash_db, target.hash_db_path)
     return successful_updates
 
-def delete_removed_documents(deleted_files, sid_cache):
+def delete_removed_documents(deleted_files, sid_cache, target=None):
+    target = target or default_target
     deleted_count = 0
     for file in deleted_files:
         item_id = sid_cache.get(file)
         if item_id:
-            if delete_from_sid(item_id):
+            if delete_from_sid(item_id, target):
                 deleted_count += 1
-                log_with_timestamp(f"Deleted removed document from SID: {file}")
+                log_with_timestamp(f"Deleted removed document from SID: {file}", target=target)
             else:
-                log_with_timestamp(f"Failed to delete removed document from SID: {file}", severity="ERROR")
+                log_with_timestamp(f"Failed to delete removed document from SID: {file}", severity="ERROR", target=target)
     return deleted_count
 
-def main():
+def write_run_report(target=None, profiler=None):
+    target = target or default_target
+    extra = {"profile": profiler.summary} if profiler else None
+    target.metrics.write_report(target.report_path, target.prometheus_path, extra=extra)
+    log_with_timestamp(f"Sync report written to {target.report_path} and {target.prometheus_path}", target=target)
+
+def sync_target(target=None, profile=False):
+    target = target or default_target
+    target.metrics.reset(target.name)
+    profiler = RunProfiler(target.profile_path) if profile else None
+    try:
+        if profiler:
+            with profiler:
+                run_update(target)
+        else:
+            run_update(target)
+    finally:
+        write_run_report(target, profiler)
+
+def main(profile=False):
+    sync_target(default_target, profile=profile)
+
+def run_update(target=None):
+    target = target or default_target
     try:
-        log_with_timestamp("Starting SID capsule update process")
+        log_with_timestamp("Starting SID capsule update process", target=target)
         start_time = datetime.now()
 
-        new_or_modified_docs, deleted_files = load_documents()
-        log_with_timestamp(f"Loaded {len(new_or_modified_docs)} new or modified documents")
+        new_or_modified_docs, deleted_files = load_documents(target)
+        if not new_or_modified_docs and not deleted_files:
+            log_with_timestamp("No changes detected in the vault", target=target)
+            return
 
-        split_docs = split_documents(new_or_modified_docs)
-        log_with_timestamp(f"Split into {len(split_docs)} chunks")
+        log_with_timestamp(f"Loaded {len(new_or_modified_docs)} new or modified documents", target=target)
 
-        successful_updates = update_documents(split_docs)
-        log_with_timestamp(f"Updated {successful_updates} documents successfully")
+        split_docs = split_documents(new_or_modified_docs, target)
+        log_with_timestamp(f"Split into {len(split_docs)} chunks", target=target)
 
-        sid_cache = load_json_file(sid_cache_path)
-        deleted_count = delete_removed_documents(deleted_files, sid_cache)
-        log_with_timestamp(f"Deleted {deleted_count} removed documents")
+        successful_updates = update_documents(split_docs, target)
+        log_with_timestamp(f"Updated {successful_updates} documents successfully", target=target)
+
+        # update_documents only refreshes the SID cache when it had chunks to upload
+        sid_cache = load_json_file(target.sid_cache_path) if split_docs else update_sid_cache(target)
+        deleted_count = delete_removed_documents(deleted_files, sid_cache, target)
+        log_with_timestamp(f"Deleted {deleted_count} removed documents", target=target)
 
         end_time = datetime.now()
         duration = end_time - start_time
-        
-        log_with_timestamp(f"SID capsule update process completed in {duration}")
-        log_with_timestamp(f"Total documents processed: {len(new_or_modified_docs)}")
-        log_with_timestamp(f"Successful updates: {successful_updates}")
-        log_with_timestamp(f"Failed updates: {len(new_or_modified_docs) - successful_updates}")
-        log_with_timestamp(f"Deleted files: {deleted_count}")
+
+        log_with_timestamp(f"SID capsule update process completed in {duration}", target=target)
+        log_with_timestamp(f"Total documents processed: {len(new_or_modified_docs)}", target=target)
+        log_with_timestamp(f"Successful updates: {successful_updates}", target=target)
+        log_with_timestamp(f"Failed updates: {len(new_or_modified_docs) - successful_updates}", target=target)
+        log_with_timestamp(f"Deleted files: {deleted_count}", target=target)
 
     except Exception as e:
-        log_with_timestamp(f"An error occurred: {str(e)}", severity="ERROR")
+        log_with_timestamp(f"An error occurred: {str(e)}", severity="ERROR", target=target)
         with open('error_log.txt', 'a') as f:
-            f.write(f"{datetime.now()}: {str(e)}\n")
+            f.write(f"{datetime.now()}: {target.name}: {str(e)}\n")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sync new and modified Obsidian notes to the SID capsule.")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Capture cProfile/tracemalloc data for the run (written to {profile_path.name})")
+    args = parser.parse_args()
+    main(profile=args.profile)